@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ORM vs Core read path for /api/places.
+
+Builds a throwaway SQLite DB with N places and compares loading full Place
+ORM instances against the column-level Core select used by list_places.
+
+    python3 bench_list_places.py --rows 100000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+
+def timed(label, fn, rows):
+    # time and memory are measured in separate runs: tracemalloc skews timings
+    t0 = time.perf_counter()
+    n = fn()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<14} {n:>8} rows  {elapsed:7.3f}s  {elapsed / rows * 1e6:6.2f} us/row  peak {peak / 1e6:7.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+    os.environ.setdefault("GOOGLE_PLACES_KEY", "bench")
+    os.environ.setdefault("BROWSER_KEY", "bench")
+    here = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(here)  # server.py mounts static/ and templates/ relative to cwd
+    sys.path.insert(0, here)
+    import server
+    from server import Place, PlaceType, engine, SessionLocal, list_places
+
+    now = datetime.utcnow()
+    types = ["hostel", "lodging", "point_of_interest", "establishment"]
+    with engine.begin() as conn:
+        conn.execute(Place.__table__.insert(), [{
+            "place_id": f"bench-{i}",
+            "name": f"Place {i}",
+            "address": f"{i} Bench Street",
+            "lat": i / 1000.0,
+            "lng": -i / 1000.0,
+            "rating": (i % 50) / 10.0,
+            "reviews_count": i % 1000,
+            "website": f"https://example.com/{i}",
+            "phone": "+1 555 0100",
+            "types": json.dumps(types),
+            "summary": "Benchmark row",
+            "created_at": now,
+            "updated_at": now,
+        } for i in range(args.rows)])
+        conn.execute(PlaceType.__table__.insert(), [
+            {"place_id": f"bench-{i}", "type": t} for i in range(args.rows) for t in types
+        ])
+
+    def orm_path():
+        # the previous implementation: full ORM instances copied into dicts
+        ses = SessionLocal()
+        try:
+            out = []
+            for p in ses.query(Place).order_by(Place.updated_at.desc()).limit(args.rows).all():
+                out.append({
+                    "place_id": p.place_id, "name": p.name, "address": p.address,
+                    "lat": p.lat, "lng": p.lng, "rating": p.rating,
+                    "reviews_count": p.reviews_count, "website": p.website, "phone": p.phone,
+                    "types": server._type_list(p.types) if p.types else [],
+                    "summary": p.summary,
+                    "updated_at": p.updated_at.isoformat() if p.updated_at else None,
+                })
+            return len(out)
+        finally:
+            ses.close()
+
+    def core_path():
+        return len(list_places(q=None, min_rating=None, types=None, types_match="any",
+                               limit=args.rows, offset=0)["items"])
+
+    print(f"DB: {os.environ['DATABASE_URL']}")
+    timed("orm", orm_path, args.rows)
+    timed("core", core_path, args.rows)
+
+
+if __name__ == "__main__":
+    main()
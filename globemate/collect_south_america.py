@@ -1,15 +1,19 @@
 #!/usr/bin/env python3
 import os
+import re
 import sys
 import json
 import time
+import argparse
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 
 # Add dependencies path
 sys.path.insert(0, '/home/runner/workspace/.pythonlibs/lib/python3.11/site-packages')
 
-from sqlalchemy import create_engine, Column, String, Float, Integer, DateTime, Text, ForeignKey
+from sqlalchemy import create_engine, Column, String, Float, Integer, DateTime, Text, ForeignKey, Index, select
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 
 # Configuration
@@ -19,7 +23,7 @@ if not GOOGLE_PLACES_KEY:
     sys.exit(1)
 
 # Database setup
-DB_URL = "sqlite:///globemate.db"
+DB_URL = os.getenv("DATABASE_URL", "sqlite:///globemate.db")
 engine = create_engine(DB_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
@@ -42,6 +46,13 @@ class Place(Base):
     
     reviews = relationship("Review", back_populates="place", cascade="all, delete-orphan")
 
+class PlaceType(Base):
+    __tablename__ = "place_types"
+    place_id = Column(String, ForeignKey("places.place_id"), primary_key=True)
+    type = Column(String, primary_key=True)
+
+    __table_args__ = (Index("ix_place_types_type_place_id", "type", "place_id"),)
+
 class Review(Base):
     __tablename__ = "reviews"
     id = Column(String, primary_key=True)
@@ -131,8 +142,63 @@ GLOBAL_SEARCH_QUERIES = [
 # Legacy alias for backward compatibility
 SOUTH_AMERICA_QUERIES = [q for q in GLOBAL_SEARCH_QUERIES if any(country in q.lower() for country in ['peru', 'colombia', 'ecuador', 'bolivia', 'chile', 'argentina', 'brazil', 'uruguay', 'paraguay'])]
 
-def google_text_search(text_query, limit=20):
-    """Search Google Places using text query"""
+# Approximate city bounding boxes (low_lat, low_lng, high_lat, high_lng) used by the
+# tiled crawl. Keys are matched as whole words against GLOBAL_SEARCH_QUERIES entries;
+# queries without a known box fall back to a single plain text search.
+CITY_BOUNDS = {
+    "paris": (48.815, 2.224, 48.902, 2.470),
+    "london": (51.286, -0.510, 51.692, 0.334),
+    "rome": (41.769, 12.341, 42.012, 12.642),
+    "barcelona": (41.320, 2.069, 41.470, 2.228),
+    "amsterdam": (52.278, 4.729, 52.431, 5.079),
+    "berlin": (52.338, 13.088, 52.675, 13.761),
+    "prague": (49.942, 14.224, 50.177, 14.707),
+    "athens": (37.900, 23.650, 38.060, 23.800),
+    "tokyo": (35.530, 139.560, 35.820, 139.920),
+    "bangkok": (13.490, 100.330, 13.960, 100.940),
+    "singapore": (1.160, 103.600, 1.470, 104.090),
+    "bali": (-8.850, 114.430, -8.060, 115.710),
+    "ho chi minh": (10.680, 106.550, 10.900, 106.820),
+    "seoul": (37.410, 126.760, 37.720, 127.190),
+    "mumbai": (18.890, 72.770, 19.270, 72.990),
+    "dubai": (24.900, 54.950, 25.370, 55.570),
+    "tel aviv": (32.030, 34.740, 32.150, 34.850),
+    "new york": (40.477, -74.259, 40.917, -73.700),
+    "san francisco": (37.700, -122.520, 37.830, -122.350),
+    "toronto": (43.580, -79.640, 43.860, -79.110),
+    "mexico city": (19.180, -99.360, 19.600, -98.940),
+    "playa del carmen": (20.580, -87.140, 20.700, -87.030),
+    "cusco": (-13.570, -72.010, -13.490, -71.900),
+    "lima": (-12.200, -77.160, -11.950, -76.920),
+    "bogota": (4.470, -74.220, 4.840, -74.000),
+    "medellin": (6.160, -75.660, 6.340, -75.530),
+    "cartagena": (10.340, -75.570, 10.460, -75.460),
+    "quito": (-0.380, -78.590, -0.030, -78.410),
+    "la paz": (-16.580, -68.200, -16.460, -68.050),
+    "santiago": (-33.650, -70.800, -33.310, -70.450),
+    "valparaiso": (-33.080, -71.680, -33.000, -71.580),
+    "buenos aires": (-34.710, -58.540, -34.520, -58.330),
+    "mendoza": (-32.980, -68.920, -32.850, -68.780),
+    "rio de janeiro": (-23.080, -43.800, -22.740, -43.100),
+    "sao paulo": (-23.800, -46.830, -23.350, -46.360),
+    "montevideo": (-34.940, -56.290, -34.770, -56.030),
+    "sydney": (-34.120, 150.900, -33.700, 151.350),
+    "melbourne": (-37.950, 144.800, -37.700, 145.100),
+    "auckland": (-37.050, 174.600, -36.700, 174.950),
+    "queenstown": (-45.070, 168.600, -44.990, 168.780),
+    "cape town": (-34.100, 18.350, -33.800, 18.700),
+    "marrakech": (31.570, -8.090, 31.700, -7.930),
+    "cairo": (29.900, 31.150, 30.150, 31.420),
+}
+
+# places:searchText returns at most this many results per request
+SEARCH_RESULT_CAP = 20
+
+def google_text_search(text_query, limit=20, bounds=None, raise_errors=False):
+    """
+    Search Google Places using text query, optionally restricted to a bounding box.
+    Errors are printed and turned into [] unless raise_errors is set.
+    """
     url = "https://places.googleapis.com/v1/places:searchText"
     headers = {
         "X-Goog-Api-Key": GOOGLE_PLACES_KEY,
@@ -140,15 +206,107 @@ def google_text_search(text_query, limit=20):
         "Content-Type": "application/json"
     }
     body = {"textQuery": text_query}
+    if bounds:
+        low_lat, low_lng, high_lat, high_lng = bounds
+        body["locationRestriction"] = {"rectangle": {
+            "low": {"latitude": low_lat, "longitude": low_lng},
+            "high": {"latitude": high_lat, "longitude": high_lng},
+        }}
     
     try:
         r = requests.post(url, headers=headers, json=body, timeout=15)
         r.raise_for_status()
         return r.json().get("places", [])
     except requests.RequestException as e:
+        if raise_errors:
+            raise
         print(f"Search error for '{text_query}': {e}")
         return []
 
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all threads sharing it"""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+def search_cell(text_query, cell, limiter, retries=3, backoff=1.0):
+    """
+    Location-restricted search for one cell, retried with exponential backoff
+    (429s, timeouts, 5xx). Returns None if every attempt failed, so a failed
+    cell is never mistaken for an empty one.
+    """
+    for attempt in range(retries + 1):
+        limiter.wait()
+        try:
+            return google_text_search(text_query, SEARCH_RESULT_CAP, cell, raise_errors=True)
+        except requests.RequestException as e:
+            if attempt == retries:
+                print(f"  Cell {tuple(round(v, 4) for v in cell)} failed after {retries + 1} attempts: {e}")
+                return None
+            time.sleep(backoff * 2 ** attempt)
+
+def find_city_bounds(text_query):
+    """Return the bounding box of the longest CITY_BOUNDS key found in the query, or None"""
+    query = text_query.lower()
+    matches = [city for city in CITY_BOUNDS if re.search(rf"\b{re.escape(city)}\b", query)]
+    if not matches:
+        return None
+    return CITY_BOUNDS[max(matches, key=len)]
+
+def split_bounds(bounds, n):
+    """Split a bounding box into an n x n grid of cells"""
+    low_lat, low_lng, high_lat, high_lng = bounds
+    dlat = (high_lat - low_lat) / n
+    dlng = (high_lng - low_lng) / n
+    return [
+        (low_lat + i * dlat, low_lng + j * dlng, low_lat + (i + 1) * dlat, low_lng + (j + 1) * dlng)
+        for i in range(n) for j in range(n)
+    ]
+
+def tiled_search(text_query, bounds, grid=3, max_depth=2, workers=4, rate=5.0, retries=3):
+    """
+    Crawl a city by issuing one location-restricted search per grid cell.
+    Cells that hit SEARCH_RESULT_CAP are split into 4 and searched again,
+    up to max_depth levels. All workers share one rate limit (rate requests/sec).
+    Results are deduped by place id; cells that still fail after retries are
+    counted and reported.
+    """
+    found = {}
+    requests_made = 0
+    failed_cells = 0
+    limiter = RateLimiter(rate)
+
+    def submit(pool, cell):
+        return pool.submit(search_cell, text_query, cell, limiter, retries)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {submit(pool, cell): (cell, 0) for cell in split_bounds(bounds, grid)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                cell, depth = pending.pop(fut)
+                requests_made += 1
+                places = fut.result()
+                if places is None:
+                    failed_cells += 1
+                    continue
+                for place in places:
+                    if place.get("id"):
+                        found.setdefault(place["id"], place)
+                if len(places) >= SEARCH_RESULT_CAP and depth < max_depth:
+                    for sub in split_bounds(cell, 2):
+                        pending[submit(pool, sub)] = (sub, depth + 1)
+    print(f"  Tiled crawl: {requests_made} cell searches, {failed_cells} failed cells, {len(found)} unique places")
+    return list(found.values())
+
 def get_place_details(place_id):
     """Get detailed information for a place"""
     url = f"https://places.googleapis.com/v1/places/{place_id}"
@@ -165,6 +323,14 @@ def get_place_details(place_id):
         print(f"Details error for {place_id}: {e}")
         return None
 
+def existing_place_ids(place_ids):
+    """Return the subset of place_ids that is already in the database"""
+    session = SessionLocal()
+    try:
+        return set(session.scalars(select(Place.place_id).where(Place.place_id.in_(list(place_ids)))))
+    finally:
+        session.close()
+
 def save_to_database(place_data):
     """Save place data to database"""
     session = SessionLocal()
@@ -179,6 +345,8 @@ def save_to_database(place_data):
             print(f"Place {place_id} already exists, skipping")
             return False
             
+        types = [t for t in dict.fromkeys(place_data.get("types") or []) if isinstance(t, str)]
+
         # Create new place
         place = Place(
             place_id=place_id,
@@ -190,12 +358,14 @@ def save_to_database(place_data):
             reviews_count=place_data.get("reviews_count"),
             website=place_data.get("website"),
             phone=place_data.get("phone"),
-            types=json.dumps(place_data.get("types", [])),
+            types=json.dumps(types),
             summary=place_data.get("summary"),
             created_at=datetime.utcnow(),
             updated_at=datetime.utcnow()
         )
         session.add(place)
+        for place_type in types:
+            session.add(PlaceType(place_id=place_id, type=place_type))
         
         # Add reviews
         for review_data in place_data.get("reviews", []):
@@ -225,7 +395,16 @@ def save_to_database(place_data):
     finally:
         session.close()
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Collect places from Google Places into globemate.db")
+    parser.add_argument("--tiled", action="store_true", help="split known cities into grid cells (see CITY_BOUNDS)")
+    parser.add_argument("--grid", type=int, default=3, help="initial grid size per city (N x N cells)")
+    parser.add_argument("--max-depth", type=int, default=2, help="how many times a full cell may be subdivided")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent cell searches")
+    parser.add_argument("--rate", type=float, default=5.0, help="max cell searches per second, shared by all workers")
+    parser.add_argument("--retries", type=int, default=3, help="retries per failed cell (exponential backoff)")
+    args = parser.parse_args(argv)
+
     print("🗺️  Starting global travel data collection...")
     print(f"📊 Will collect data for {len(GLOBAL_SEARCH_QUERIES)} queries")
     
@@ -236,18 +415,28 @@ def main():
         print(f"\n[{i}/{len(GLOBAL_SEARCH_QUERIES)}] Searching: {query}")
         
         # Search places
-        places = google_text_search(query, limit=10)
+        bounds = find_city_bounds(query) if args.tiled else None
+        if bounds:
+            places = tiled_search(query, bounds, grid=args.grid, max_depth=args.max_depth,
+                                  workers=args.workers, rate=args.rate, retries=args.retries)
+        else:
+            places = google_text_search(query, limit=10)
         if not places:
             print("  No results found")
             continue
             
         print(f"  Found {len(places)} places")
         total_found += len(places)
+
+        # Place Details is billed per call; places already saved would be skipped anyway
+        known = existing_place_ids(p["id"] for p in places if p.get("id"))
+        if known:
+            print(f"  Skipping {len(known)} places already in the database")
         
         # Process each place
         for place in places:
             place_id = place.get("id")
-            if not place_id:
+            if not place_id or place_id in known:
                 continue
                 
             # Get detailed information
@@ -266,7 +455,7 @@ def main():
                 "reviews_count": details.get("userRatingCount"),
                 "website": details.get("websiteUri"),
                 "phone": details.get("internationalPhoneNumber"),
-                "types": [place.get("types") or []],
+                "types": place.get("types") or [],
                 "summary": (details.get("editorialSummary") or {}).get("text"),
                 "reviews": [
                     {
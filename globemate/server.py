@@ -1,5 +1,7 @@
 import os
 import json
+import logging
+import threading
 import requests
 from datetime import datetime
 from typing import List, Optional
@@ -11,10 +13,14 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from sqlalchemy import (
-    create_engine, Column, String, Float, Integer, DateTime, Text, ForeignKey, Boolean
+    create_engine, Column, String, Float, Integer, DateTime, Text, ForeignKey, Boolean,
+    Index, select, func, inspect, text
 )
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 
+import snapshot
+
 # ==== Secrets ====
 GOOGLE_PLACES_KEY = os.getenv("GOOGLE_PLACES_KEY")   # Places API (SERVER)
 BROWSER_KEY = os.getenv("BROWSER_KEY")               # Maps JS (BROWSER)
@@ -65,6 +71,15 @@ class Place(Base):
     updated_at = Column(DateTime, default=datetime.utcnow)
 
     reviews = relationship("Review", back_populates="place", cascade="all, delete-orphan")
+    type_rows = relationship("PlaceType", cascade="all, delete-orphan")
+
+class PlaceType(Base):
+    # טבלה מנורמלת של places.types, כדי לסנן לפי סוג עם אינדקס במקום LIKE על JSON
+    __tablename__ = "place_types"
+    place_id = Column(String, ForeignKey("places.place_id"), primary_key=True)
+    type = Column(String, primary_key=True)
+
+    __table_args__ = (Index("ix_place_types_type_place_id", "type", "place_id"),)
 
 class Review(Base):
     __tablename__ = "reviews"
@@ -86,12 +101,60 @@ class SocialPost(Base):
     platform = Column(String, default="facebook")
     place_id = Column(String, ForeignKey("places.place_id"), nullable=True)
     text = Column(Text)
-    created_at = Column(DateTime)
+    created_at = Column(DateTime)    # מתי הפוסט פורסם (created_time של Facebook)
+    collected_at = Column(DateTime, default=datetime.utcnow)  # מתי נאסף — ה-watermark של snapshot
     url = Column(String)
     raw = Column(Text)  # JSON dump of original
 
 Base.metadata.create_all(engine)
 
+def _add_missing_columns():
+    # create_all לא מוסיף עמודות לטבלה קיימת; DB ישן מקבל כאן את העמודות החדשות
+    existing = {c["name"] for c in inspect(engine).get_columns("social_posts")}
+    if "collected_at" not in existing:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE social_posts ADD COLUMN collected_at DATETIME"))
+            # זמן האיסוף של פוסטים ישנים לא ידוע; מסמנים עכשיו כדי שייכנסו ל-snapshot הבא
+            conn.execute(SocialPost.__table__.update().values(collected_at=datetime.utcnow()))
+
+_add_missing_columns()
+
+def _type_list(val) -> List[str]:
+    """
+    מחזיר רשימת types שטוחה וללא כפילויות מ-list / מחרוזת JSON / רשימה מקוננת
+    (הקולקטור הישן שמר [[...]]). מחרוזת שאינה JSON ("lodging") היא סוג יחיד.
+    """
+    if isinstance(val, str):
+        try:
+            val = json.loads(val)
+        except ValueError:
+            return [val] if val else []
+    if isinstance(val, list) and all(isinstance(v, str) for v in val):
+        return list(dict.fromkeys(v for v in val if v))  # המקרה הנפוץ: רשימה שטוחה
+    out: List[str] = []
+    stack = [val]
+    while stack:
+        v = stack.pop()
+        if isinstance(v, list):
+            stack.extend(reversed(v))
+        elif isinstance(v, str) and v and v not in out:
+            out.append(v)
+    return out
+
+def _backfill_place_types():
+    # מילוי place_types עבור מקומות קיימים שעוד אין להם שורות (DB ישן / קולקטור ישן)
+    with engine.begin() as conn:
+        rows = conn.execute(
+            select(Place.place_id, Place.types)
+            .where(Place.types.isnot(None))
+            .where(Place.place_id.not_in(select(PlaceType.place_id)))
+        ).all()
+        values = [{"place_id": pid, "type": t} for pid, raw in rows for t in _type_list(raw)]
+        if values:
+            conn.execute(PlaceType.__table__.insert(), values)
+
+_backfill_place_types()
+
 # ==== Pages ====
 @app.get("/", response_class=HTMLResponse)
 def home(request: Request):
@@ -116,8 +179,66 @@ FIELDS = ",".join([
     "reviews"
 ])
 
-@app.get("/api/place-details")
-def place_details(place_id: str):
+# ==== Single-flight: איחוד קריאות upstream זהות שרצות במקביל ====
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """
+    קוראים במקביל עם אותו key חולקים קריאה אחת ל-upstream: הראשון מבצע,
+    השאר ממתינים ומקבלים את אותה תוצאה או את אותה שגיאה. אין cache — ברגע
+    שהקריאה מסתיימת, קריאה הבאה עם אותו key יוצאת מחדש.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: dict = {}
+        self.stats = {"calls": 0, "upstream": 0, "coalesced": 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            self.stats["calls"] += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.stats["upstream"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.done.set()
+
+details_flight = SingleFlight()
+search_flight = SingleFlight()
+
+@app.get("/api/upstream-stats")
+def upstream_stats():
+    """כמה קריאות ל-Google נחסכו בזכות single-flight (coalesced)."""
+    return {"place_details": dict(details_flight.stats), "text_search": dict(search_flight.stats)}
+
+def _fetch_place_details(place_id: str) -> dict:
+    """מושך פרטים מ-Google ומחזיר dict מנורמל (בלי לעבור דרך JSONResponse)."""
+    # עותק לכל קורא, כי התוצאה משותפת בין כל הממתינים
+    return dict(details_flight.do(place_id, lambda: _fetch_place_details_upstream(place_id)))
+
+def _fetch_place_details_upstream(place_id: str) -> dict:
     url = f"https://places.googleapis.com/v1/places/{place_id}"
     headers = {"X-Goog-Api-Key": GOOGLE_PLACES_KEY, "X-Goog-FieldMask": FIELDS}
     r = requests.get(url, headers=headers, timeout=15)
@@ -148,77 +269,105 @@ def place_details(place_id: str):
             } for i, rv in enumerate(p.get("reviews", []))
         ]
     }
-    return JSONResponse(out)
+    return out
+
+@app.get("/api/place-details")
+def place_details(place_id: str):
+    return JSONResponse(_fetch_place_details(place_id))
 
 # ==== Save collected places to DB ====
+# כללי העדכון של _apply_place_item (ו-_merge_place_items, שחייב להתנהג זהה):
+# ערך ריק/0 לא דורס בשדות הטקסט ו-reviews_count; None לא דורס במספרים
+_SET_IF_TRUTHY = ("name", "address", "reviews_count", "website", "phone", "summary")
+_SET_IF_NOT_NONE = ("lat", "lng", "rating")
+
+def _place_field_applies(field: str, value) -> bool:
+    """האם _apply_place_item יכתוב את value לשדה field."""
+    if field in _SET_IF_TRUTHY:
+        return bool(value)
+    if field in _SET_IF_NOT_NONE:
+        return value is not None
+    if field == "types":
+        return isinstance(value, (list, str))  # גם [] — מנקה את ה-types
+    return value is not None
+
+def _apply_place_item(ses, item: dict) -> bool:
+    """
+    מעדכן/יוצר Place (+ ביקורות) מתוך item בודד בתוך session פתוח.
+    מחזיר False אם אין place_id. לא עושה commit.
+    """
+    place_id = item.get("place_id")
+    if not place_id:
+        return False
+
+    place = ses.get(Place, place_id)
+    if not place:
+        place = Place(place_id=place_id, created_at=datetime.utcnow())
+        ses.add(place)
+
+    # עדכון שדות
+    for field in _SET_IF_TRUTHY + _SET_IF_NOT_NONE:
+        if _place_field_applies(field, item.get(field)):
+            setattr(place, field, item.get(field))
+    # types יכול להגיע כ-list או כ-string JSON; נשמר גם ב-place_types
+    if _place_field_applies("types", item.get("types")):
+        types_list = _type_list(item.get("types"))
+        place.types = json.dumps(types_list, ensure_ascii=False)
+        _set_place_types(place, types_list)
+    place.updated_at = datetime.utcnow()
+
+    # שמירת ביקורות אם צורפו בבקשה
+    for rv in item.get("reviews", []) or []:
+        rid = rv.get("id")
+        if not rid:
+            continue
+        if ses.get(Review, rid):
+            continue
+        ses.add(Review(
+            id=rid,
+            place_id=place_id,
+            source=rv.get("source") or "google",
+            rating=rv.get("rating"),
+            text=rv.get("text"),
+            lang=rv.get("lang"),
+            published_at=_maybe_datetime(rv.get("published_at")),
+            author=rv.get("author"),
+            url=rv.get("url"),
+        ))
+    return True
+
+def _set_place_types(place: Place, types_list: List[str]):
+    existing = {pt.type: pt for pt in place.type_rows}
+    for t, pt in existing.items():
+        if t not in types_list:
+            place.type_rows.remove(pt)
+    for t in types_list:
+        if t not in existing:
+            place.type_rows.append(PlaceType(type=t))
+
 @app.post("/api/save-places")
 def save_places(payload: List[dict] = Body(...)):
     """
     קולט מערך של מקומות (כפי שה-frontend מייצא/מאחד),
     ושומר לטבלאות places + reviews (אם קיימות בבקשה).
+    במצב write-behind (SAVE_WRITE_BEHIND=1) הבקשה נכנסת לתור ומאושרת מיד (202).
     """
     if not isinstance(payload, list):
         raise HTTPException(400, "Payload must be a JSON array")
 
+    if write_behind is not None:
+        try:
+            queued = write_behind.submit(payload)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        return JSONResponse({"saved_places": queued, "queued": True}, status_code=202)
+
     ses = SessionLocal()
     saved = 0
     try:
         for item in payload:
-            place_id = item.get("place_id")
-            if not place_id:
-                continue
-
-            place = ses.get(Place, place_id)
-            if not place:
-                place = Place(place_id=place_id, created_at=datetime.utcnow())
-                ses.add(place)
-
-            # עדכון שדות
-            if item.get("name"):
-                place.name = item.get("name")
-            if item.get("address"):
-                place.address = item.get("address")
-            if item.get("lat") is not None:
-                place.lat = item.get("lat")
-            if item.get("lng") is not None:
-                place.lng = item.get("lng")
-            if item.get("rating") is not None:
-                place.rating = item.get("rating")
-            if item.get("reviews_count"):
-                place.reviews_count = item.get("reviews_count")
-            if item.get("website"):
-                place.website = item.get("website")
-            if item.get("phone"):
-                place.phone = item.get("phone")
-            # types יכול להגיע כ-list או כ-string JSON
-            types_val = item.get("types")
-            if isinstance(types_val, list):
-                place.types = json.dumps(types_val, ensure_ascii=False)
-            elif isinstance(types_val, str):
-                place.types = types_val
-            if item.get("summary"):
-                place.summary = item.get("summary")
-            place.updated_at = datetime.utcnow()
-
-            # שמירת ביקורות אם צורפו בבקשה
-            for rv in item.get("reviews", []) or []:
-                rid = rv.get("id")
-                if not rid:
-                    continue
-                if ses.get(Review, rid):
-                    continue
-                ses.add(Review(
-                    id=rid,
-                    place_id=place_id,
-                    source=rv.get("source") or "google",
-                    rating=rv.get("rating"),
-                    text=rv.get("text"),
-                    lang=rv.get("lang"),
-                    published_at=_maybe_datetime(rv.get("published_at")),
-                    author=rv.get("author"),
-                    url=rv.get("url"),
-                ))
-            saved += 1
+            if _apply_place_item(ses, item):
+                saved += 1
 
         ses.commit()
     except Exception as e:
@@ -236,45 +385,363 @@ def _maybe_datetime(s: Optional[str]) -> Optional[datetime]:
     except Exception:
         return None
 
+# ==== Write-behind buffer for /api/save-places ====
+# כשמופעל, בקשות שמירה נאספות בזיכרון (ממוזגות לפי place_id, הכתיבה האחרונה גוברת)
+# ונכתבות ל-DB בטרנזקציה אחת גדולה כשהתור מגיע ל-WRITE_BEHIND_MAX_ITEMS או אחרי
+# WRITE_BEHIND_MAX_DELAY שניות. כל בקשה נרשמת קודם ל-journal על הדיסק, כך שאחרי
+# קריסה או flush שנכשל הנתונים נטענים מחדש בעלייה הבאה.
+SAVE_WRITE_BEHIND = os.getenv("SAVE_WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_MAX_ITEMS = int(os.getenv("WRITE_BEHIND_MAX_ITEMS", "500"))
+WRITE_BEHIND_MAX_DELAY = float(os.getenv("WRITE_BEHIND_MAX_DELAY", "2.0"))
+WRITE_BEHIND_JOURNAL = os.getenv("WRITE_BEHIND_JOURNAL", "save_places.journal")
+# fsync ל-journal לפני אישור 202 (שורד גם קריסת OS/הפסקת חשמל). ה-fsync הוא group commit:
+# בקשות שנרשמו בזמן ש-fsync רץ מאושרות יחד ב-fsync אחד הבא, כך שתחת עומס יש הרבה
+# פחות fsyncs מבקשות. 0 = רק write, שורד קריסת תהליך בלבד.
+WRITE_BEHIND_FSYNC = os.getenv("WRITE_BEHIND_FSYNC", "1") == "1"
+WRITE_BEHIND_DEAD_LETTER = os.getenv("WRITE_BEHIND_DEAD_LETTER", "save_places.dead.jsonl")
+
+logger = logging.getLogger("globemate")
+
+def _merge_place_items(old: Optional[dict], new: dict) -> dict:
+    """
+    ממזג שני עדכונים לאותו place_id כך שהחלת התוצאה דרך _apply_place_item
+    שקולה להחלת old ואז new: שדה נדרס רק אם _place_field_applies מאשר אותו,
+    וביקורת עם id שכבר קיים לא נדרסת (כמו ב-_apply_place_item).
+    """
+    if not old:
+        return dict(new)
+    merged = dict(old)
+    for k, v in new.items():
+        if k != "reviews" and _place_field_applies(k, v):
+            merged[k] = v
+    reviews = {}
+    for rv in (old.get("reviews") or []) + (new.get("reviews") or []):
+        if isinstance(rv, dict) and rv.get("id") and rv["id"] not in reviews:
+            reviews[rv["id"]] = rv
+    merged["reviews"] = list(reviews.values())
+    return merged
+
+def _check_place_item(item: dict):
+    """
+    בדיקת מבנה לפני שפריט נכנס ל-journal: פריט שנרשם שם חייב להיות ניתן למיזוג,
+    אחרת הוא מפיל את ה-replay בכל עלייה. זורק ValueError.
+    """
+    if not isinstance(item.get("place_id"), str):
+        raise ValueError("place_id must be a string")
+    reviews = item.get("reviews")
+    if reviews is not None and not (isinstance(reviews, list) and all(isinstance(rv, dict) for rv in reviews)):
+        raise ValueError(f"reviews of {item['place_id']} must be a list of objects")
+
+class WriteBehindBuffer:
+    def __init__(self, max_items: int, max_delay: float, journal_path: str):
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self.journal_path = journal_path
+        self.dead_letter_path = WRITE_BEHIND_DEAD_LETTER
+        self._pending: dict = {}
+        self._lock = threading.Lock()         # מגן על _pending ועל ה-journal
+        self._flush_lock = threading.Lock()   # flush אחד בכל פעם
+        # group commit: מספר סידורי לכל append, ועד איזה מספר ה-journal כבר עבר fsync
+        self._sync_cond = threading.Condition()
+        self._written_seq = 0
+        self._synced_seq = 0
+        self._syncing = False
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"submitted": 0, "coalesced": 0, "flushes": 0, "flushed_places": 0, "failed_flushes": 0,
+                      "dead_lettered": 0, "journal_syncs": 0}
+
+    # -- journal --
+    def _journal_append(self, items: List[dict]) -> int:
+        # נקרא תחת _lock; רק write ל-OS. ה-fsync נעשה אחר כך ב-_journal_sync, מחוץ ל-_lock
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(items, ensure_ascii=False) + "\n")
+        self._written_seq += 1
+        return self._written_seq
+
+    def _journal_sync(self, seq: int):
+        """
+        ממתין עד שה-append מספר seq עבר fsync. ה-thread הראשון שמגיע מבצע fsync אחד
+        שמכסה את כל מה שנכתב עד אז; כל מי שהמתין לו מאושר יחד. אם ה-fsync נכשל,
+        הממתינים מתעוררים ואחד מהם מנסה שוב.
+        """
+        with self._sync_cond:
+            while self._synced_seq < seq:
+                if not self._syncing:
+                    self._syncing = True
+                    target = self._written_seq
+                    break
+                self._sync_cond.wait()
+            else:
+                return
+        synced = False
+        try:
+            try:
+                fd = os.open(self.journal_path, os.O_RDONLY)
+            except FileNotFoundError:
+                pass  # flush כבר כתב הכול ל-DB ומחק את ה-journal
+            else:
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            synced = True
+        finally:
+            with self._sync_cond:
+                self._syncing = False
+                if synced:
+                    # journal שנכתב מחדש (_journal_rewrite) עובר fsync משלו, אז גם אז הכיסוי נכון
+                    self._synced_seq = max(self._synced_seq, target)
+                    self.stats["journal_syncs"] += 1
+                self._sync_cond.notify_all()
+
+    def _journal_rewrite(self):
+        # נקרא תחת _lock: ה-journal משקף בדיוק את מה שעוד לא נכתב ל-DB
+        if not self._pending:
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            return
+        tmp = self.journal_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps(list(self._pending.values()), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.journal_path)
+
+    def _dead_letter(self, item: dict, error: Exception):
+        # פריט שנכשל גם לבד: לא חוזר לתור (אחרת הוא חוסם את כל השמירות), נשמר כאן לבדיקה ידנית
+        logger.error("write-behind: dropping place %s: %s", item.get("place_id"), error)
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "at": datetime.utcnow().isoformat(),
+                "error": str(error),
+                "item": item,
+            }, ensure_ascii=False, default=str) + "\n")
+        self.stats["dead_lettered"] += 1
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    items = json.loads(line)
+                except ValueError:
+                    continue  # שורה חלקית מקריסה באמצע כתיבה
+                for item in items if isinstance(items, list) else [items]:
+                    try:
+                        if isinstance(item, dict) and item.get("place_id"):
+                            _check_place_item(item)
+                        self._enqueue([item])
+                    except Exception as e:
+                        # journal ישן/פגום לא אמור למנוע עלייה
+                        self._dead_letter(item if isinstance(item, dict) else {"raw": item}, e)
+        if self._pending:
+            logger.info("write-behind: replayed %d places from %s", len(self._pending), self.journal_path)
+
+    # -- queue --
+    def _enqueue(self, items: List[dict]) -> int:
+        accepted = 0
+        for item in items:
+            if not isinstance(item, dict) or not item.get("place_id"):
+                continue
+            pid = item["place_id"]
+            if pid in self._pending:
+                self.stats["coalesced"] += 1
+            self._pending[pid] = _merge_place_items(self._pending.get(pid), item)
+            accepted += 1
+        return accepted
+
+    def submit(self, items: List[dict]) -> int:
+        """
+        מכניס פריטים לתור. פריט בלי place_id מדולג (כמו במסלול הסינכרוני);
+        פריט עם מבנה שגוי זורק ValueError לפני שמשהו נרשם ל-journal.
+        """
+        items = [it for it in items if isinstance(it, dict) and it.get("place_id")]
+        for item in items:
+            _check_place_item(item)
+        if not items:
+            return 0
+        with self._lock:
+            seq = self._journal_append(items)
+            accepted = self._enqueue(items)
+            self.stats["submitted"] += accepted
+            if len(self._pending) >= self.max_items:
+                self._wake.set()
+        if WRITE_BEHIND_FSYNC:
+            self._journal_sync(seq)
+        return accepted
+
+    def _apply_one_by_one(self, ses, batch: dict):
+        """
+        נקרא אחרי שה-batch כולו נכשל: כל פריט ב-savepoint משלו.
+        מחזיר (written, retry) — retry הם פריטים שנכשלו בשגיאת DB זמנית (נעול/דיסק)
+        וחוזרים לתור; שאר הכישלונות עוברים ל-dead letter.
+        """
+        written, retry, dead = [], {}, []
+        for pid, item in batch.items():
+            savepoint = ses.begin_nested()
+            try:
+                _apply_place_item(ses, item)
+                ses.flush()
+                savepoint.commit()
+                written.append(pid)
+            except OperationalError:
+                savepoint.rollback()
+                retry[pid] = item
+            except Exception as e:
+                savepoint.rollback()
+                dead.append((item, e))
+        ses.commit()
+        with self._lock:
+            for item, e in dead:
+                self._dead_letter(item, e)
+        return written, retry
+
+    def _requeue(self, batch: dict):
+        # נקרא תחת _lock; עדכונים שהגיעו בינתיים גוברים
+        for pid, item in batch.items():
+            self._pending[pid] = _merge_place_items(item, self._pending[pid]) if pid in self._pending else item
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            ses = SessionLocal()
+            retry: dict = {}
+            try:
+                try:
+                    for item in batch.values():
+                        _apply_place_item(ses, item)
+                    ses.commit()
+                    written = len(batch)
+                except Exception as e:
+                    ses.rollback()
+                    logger.warning("write-behind: batch of %d places failed (%s), retrying one by one", len(batch), e)
+                    written_ids, retry = self._apply_one_by_one(ses, batch)
+                    written = len(written_ids)
+            except Exception as e:
+                ses.rollback()
+                with self._lock:
+                    self._requeue(batch)
+                    self.stats["failed_flushes"] += 1
+                logger.error("write-behind: flush of %d places failed: %s", len(batch), e)
+                return 0
+            finally:
+                ses.close()
+
+            with self._lock:
+                if retry:
+                    self._requeue(retry)
+                    self.stats["failed_flushes"] += 1
+                self._journal_rewrite()
+                self.stats["flushes"] += 1
+                self.stats["flushed_places"] += written
+            return written
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    # -- lifecycle --
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(timeout=self.max_delay)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        with self._lock:
+            self._replay_journal()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="write-behind-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()  # flush-on-shutdown; אם נכשל, ה-journal נשאר לעלייה הבאה
+
+write_behind: Optional[WriteBehindBuffer] = (
+    WriteBehindBuffer(WRITE_BEHIND_MAX_ITEMS, WRITE_BEHIND_MAX_DELAY, WRITE_BEHIND_JOURNAL)
+    if SAVE_WRITE_BEHIND else None
+)
+
+@app.on_event("startup")
+def _start_write_behind():
+    if write_behind is not None:
+        write_behind.start()
+
+@app.on_event("shutdown")
+def _stop_write_behind():
+    if write_behind is not None:
+        write_behind.stop()
+
+@app.post("/api/save-places/flush")
+def flush_save_places():
+    """כופה flush של תור ה-write-behind (שימושי לבדיקות/לפני גיבוי)."""
+    if write_behind is None:
+        return {"enabled": False, "flushed": 0, "pending": 0}
+    flushed = write_behind.flush()
+    return {"enabled": True, "flushed": flushed, "pending": write_behind.pending(), "stats": write_behind.stats}
+
 # ==== Query places (basic filters) ====
+PLACE_LIST_COLUMNS = (
+    Place.place_id, Place.name, Place.address, Place.lat, Place.lng, Place.rating,
+    Place.reviews_count, Place.website, Place.phone, Place.types, Place.summary, Place.updated_at,
+)
+PLACE_LIST_KEYS = tuple(c.key for c in PLACE_LIST_COLUMNS)
+
 @app.get("/api/places")
 def list_places(
     q: Optional[str] = Query(None, description="חיפוש בשם/כתובת"),
     min_rating: Optional[float] = Query(None),
+    types: Optional[str] = Query(None, description="סינון לפי סוג, מופרד בפסיקים: lodging,tourist_attraction"),
+    types_match: str = Query("any", pattern="^(any|all)$", description="any = לפחות סוג אחד, all = כל הסוגים"),
     limit: int = 50,
     offset: int = 0,
 ):
-    ses = SessionLocal()
-    try:
-        qry = ses.query(Place)
-        if q:
-            like = f"%{q}%"
-            qry = qry.filter((Place.name.ilike(like)) | (Place.address.ilike(like)))
-        if min_rating is not None:
-            qry = qry.filter(Place.rating >= min_rating)
-        total = qry.count()
-        rows = qry.order_by(Place.updated_at.desc()).offset(offset).limit(limit).all()
+    # Core select על עמודות בלבד — בלי identity map ו-instrumentation של ORM
+    conds = []
+    if q:
+        like = f"%{q}%"
+        conds.append((Place.name.ilike(like)) | (Place.address.ilike(like)))
+    if min_rating is not None:
+        conds.append(Place.rating >= min_rating)
+    wanted = [t.strip() for t in (types or "").split(",") if t.strip()]
+    if wanted:
+        # משתמש באינדקס (type, place_id) של place_types
+        matching = select(PlaceType.place_id).where(PlaceType.type.in_(wanted))
+        if types_match == "all":
+            matching = matching.group_by(PlaceType.place_id).having(
+                func.count(func.distinct(PlaceType.type)) == len(set(wanted))
+            )
+        conds.append(Place.place_id.in_(matching))
+
+    with engine.connect() as conn:
+        total = conn.execute(select(func.count()).select_from(Place).where(*conds)).scalar_one()
+        rows = conn.execute(
+            select(*PLACE_LIST_COLUMNS).where(*conds)
+            .order_by(Place.updated_at.desc()).offset(offset).limit(limit)
+        )
         out = []
-        for p in rows:
-            out.append({
-                "place_id": p.place_id,
-                "name": p.name,
-                "address": p.address,
-                "lat": p.lat,
-                "lng": p.lng,
-                "rating": p.rating,
-                "reviews_count": p.reviews_count,
-                "website": p.website,
-                "phone": p.phone,
-                "types": json.loads(p.types) if p.types and isinstance(p.types, str) else [],
-                "summary": p.summary,
-                "updated_at": p.updated_at.isoformat() if p.updated_at and hasattr(p.updated_at, 'isoformat') else None
-            })
-        return {"total": total, "items": out}
-    finally:
-        ses.close()
+        for row in rows:
+            item = dict(zip(PLACE_LIST_KEYS, row))
+            item["types"] = _type_list(item["types"]) if item["types"] else []
+            updated_at = item["updated_at"]
+            item["updated_at"] = updated_at.isoformat() if updated_at and hasattr(updated_at, 'isoformat') else None
+            out.append(item)
+    return {"total": total, "items": out}
 
 # ==== Google Text Search Collector ====
+COLLECT_CHUNK_SIZE = int(os.getenv("COLLECT_CHUNK_SIZE", "10"))  # מקומות לכל commit
 SEARCH_FIELDS = "places.id,places.displayName,places.formattedAddress,places.location,places.rating,places.userRatingCount,places.types"
 
 def _google_text_search(text_query: str, location_bias: dict | None = None, max_results: int = 20):
@@ -282,6 +749,10 @@ def _google_text_search(text_query: str, location_bias: dict | None = None, max_
     קריאת places:searchText — מחזירה רשימת מקומות בסיסית.
     location_bias: dict כמו {"circle": {"center": {"latitude": ..., "longitude": ...}, "radius": 5000}}
     """
+    key = (text_query, json.dumps(location_bias, sort_keys=True), max_results)
+    return list(search_flight.do(key, lambda: _google_text_search_upstream(text_query, location_bias, max_results)))
+
+def _google_text_search_upstream(text_query: str, location_bias: dict | None, max_results: int):
     url = "https://places.googleapis.com/v1/places:searchText"
     headers = {
         "X-Goog-Api-Key": GOOGLE_PLACES_KEY,
@@ -322,7 +793,15 @@ def collect_google(
 
     ses = SessionLocal()
     saved = 0
-    details_payload = []
+    chunk = []
+
+    def write_chunk() -> int:
+        # 3) שמירה ל-DB בעזרת אותו מסלול של /api/save-places, ב-chunks חסומים
+        n = sum(1 for item in chunk if _apply_place_item(ses, item))
+        ses.commit()
+        ses.expunge_all()
+        chunk.clear()
+        return n
 
     try:
         for p in places[:limit]:
@@ -332,17 +811,12 @@ def collect_google(
 
             # 2) פרטים מלאים + ביקורות
             try:
-                detail = place_details(pid)  # משתמש בפונקציה הקיימת שמחזירה JSONResponse
-                if isinstance(detail, JSONResponse):
-                    detail = detail.body
-                    if isinstance(detail, (bytes, bytearray)):
-                        detail = json.loads(detail.decode("utf-8"))
-                    elif isinstance(detail, str):
-                        detail = json.loads(detail)
-                details_payload.append(detail)
+                detail = _fetch_place_details(pid)
+                detail.setdefault("types", p.get("types") or [])  # FIELDS לא כולל types
+                chunk.append(detail)
             except Exception:
                 # אם נכשל, לפחות נשמור את המידע הבסיסי
-                details_payload.append({
+                chunk.append({
                     "place_id": pid,
                     "name": (p.get("displayName") or {}).get("text"),
                     "address": p.get("formattedAddress"),
@@ -354,63 +828,11 @@ def collect_google(
                     "reviews": []
                 })
 
-        # 3) שמירה ל-DB בעזרת אותו מסלול של /api/save-places
-        #    (אפשר לשחזר את הלוגיקה פה כדי לא לקרוא HTTP פנימי)
-        for item in details_payload:
-            place_id = item.get("place_id")
-            if not place_id:
-                continue
-
-            place = ses.get(Place, place_id)
-            if not place:
-                place = Place(place_id=place_id, created_at=datetime.utcnow())
-                ses.add(place)
-
-            if item.get("name"):
-                place.name = item.get("name")
-            if item.get("address"):
-                place.address = item.get("address")
-            if item.get("lat") is not None:
-                place.lat = item.get("lat")
-            if item.get("lng") is not None:
-                place.lng = item.get("lng")
-            if item.get("rating") is not None:
-                place.rating = item.get("rating")
-            if item.get("reviews_count"):
-                place.reviews_count = item.get("reviews_count")
-            if item.get("website"):
-                place.website = item.get("website")
-            if item.get("phone"):
-                place.phone = item.get("phone")
-            types_val = item.get("types")
-            if isinstance(types_val, list):
-                place.types = json.dumps(types_val, ensure_ascii=False)
-            elif isinstance(types_val, str):
-                place.types = types_val
-            if item.get("summary"):
-                place.summary = item.get("summary")
-            place.updated_at = datetime.utcnow()
-
-            for rv in item.get("reviews", []) or []:
-                rid = rv.get("id")
-                if not rid:
-                    continue
-                if ses.get(Review, rid):
-                    continue
-                ses.add(Review(
-                    id=rid,
-                    place_id=place_id,
-                    source=rv.get("source") or "google",
-                    rating=rv.get("rating"),
-                    text=rv.get("text"),
-                    lang=rv.get("lang"),
-                    published_at=_maybe_datetime(rv.get("published_at")),
-                    author=rv.get("author"),
-                    url=rv.get("url"),
-                ))
-            saved += 1
+            if len(chunk) >= COLLECT_CHUNK_SIZE:
+                saved += write_chunk()
 
-        ses.commit()
+        if chunk:
+            saved += write_chunk()
     except Exception as e:
         ses.rollback()
         raise HTTPException(500, f"Collector error: {e}")
@@ -419,6 +841,23 @@ def collect_google(
 
     return {"query": q, "found": len(places), "saved": saved}
 
+# ==== Columnar snapshot (Parquet) ====
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+
+@app.post("/api/snapshot")
+def create_snapshot(incremental: bool = True):
+    """
+    כותב את places/reviews/social_posts ל-Parquet תחת SNAPSHOT_DIR, מחולק לפי תאריך איסוף,
+    כדי שניתוחים ירוצו על הקבצים ולא על ה-DB החי. ראו snapshot.py.
+    incremental=true כותב רק שורות שהשתנו מאז ה-snapshot הקודם.
+    """
+    if write_behind is not None:
+        write_behind.flush()
+    try:
+        return snapshot.write_snapshot(engine, SNAPSHOT_DIR, incremental=incremental)
+    except RuntimeError as e:
+        raise HTTPException(501, str(e))
+
 # ==== Facebook Graph API (server-side) ====
 @app.get("/api/facebook/posts")
 def fb_posts(page_id: str, limit: int = 20):
@@ -454,6 +893,7 @@ def fb_posts(page_id: str, limit: int = 20):
                 place_id=None,  # אפשר לקשר ידנית/בניתוח NLP בהמשך
                 text=post.get("message"),
                 created_at=_maybe_datetime(post.get("created_time")),
+                collected_at=datetime.utcnow(),
                 url=post.get("permalink_url"),
                 raw=json.dumps(post, ensure_ascii=False),
             ))
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Columnar snapshot of globemate.db for analytics.
+
+Writes places, reviews and social_posts to compressed Parquet datasets,
+hive-partitioned by collection date:
+
+    snapshots/places/collected_date=2025-08-20/part-<run>-0.parquet
+    snapshots/reviews/collected_date=2025-08-20/part-<run>-0.parquet
+    snapshots/social_posts/collected_date=2025-08-21/part-<run>-0.parquet
+
+Rows are streamed from the DB in record batches, so memory stays bounded by
+the batch size. A full snapshot replaces each table's dataset. With
+--incremental only rows changed since the previous run (places.updated_at,
+social_posts.collected_at) are added as new part files; a row that was
+updated again appears once per change, so readers keep the latest row per id.
+
+    python3 snapshot.py --out snapshots
+    python3 snapshot.py --out snapshots --incremental
+
+Requires pyarrow.
+"""
+import os
+import sys
+import json
+import uuid
+import shutil
+import argparse
+from datetime import datetime, date, timedelta
+
+# Add dependencies path
+sys.path.insert(0, '/home/runner/workspace/.pythonlibs/lib/python3.11/site-packages')
+
+from sqlalchemy import create_engine, MetaData, select, or_
+
+STATE_FILE = "_snapshot_state.json"
+PARTITION_COLUMN = "collected_date"
+# Rows are stamped (updated_at) before their transaction commits, and a write-behind
+# batch or collector chunk can commit well after that. Each run only exports rows
+# stamped at least this long ago, so every row it can see is already committed.
+DEFAULT_LAG = timedelta(seconds=int(os.getenv("SNAPSHOT_LAG_SECONDS", "900")))
+
+
+def _arrow_type(pa, column):
+    try:
+        py = column.type.python_type
+    except NotImplementedError:
+        py = str
+    if py is float:
+        return pa.float64()
+    if py is bool:
+        return pa.bool_()
+    if py is int:
+        return pa.int64()
+    if py is datetime:
+        return pa.timestamp("us")
+    if py is date:
+        return pa.date32()
+    return pa.string()
+
+
+def _snapshot_queries(metadata):
+    """
+    (name, table, select, timestamp column) per exported table; reviews take their
+    place's updated_at, social posts their collected_at (created_at is the Facebook
+    publish time, so posts collected late would be missed). Tables missing from
+    the DB (e.g. social_posts in a DB created only by the batch collector) are skipped.
+    """
+    tables = metadata.tables
+    out = []
+    places = tables.get("places")
+    if places is not None:
+        out.append(("places", places, select(places, places.c.updated_at.label("_ts")), places.c.updated_at))
+        reviews = tables.get("reviews")
+        if reviews is not None:
+            out.append(("reviews", reviews,
+                        select(reviews, places.c.updated_at.label("_ts")).select_from(
+                            reviews.join(places, reviews.c.place_id == places.c.place_id)),
+                        places.c.updated_at))
+    social = tables.get("social_posts")
+    if social is not None:
+        # DBs not yet migrated by server.py have no collected_at
+        ts = social.c.collected_at if "collected_at" in social.c else social.c.created_at
+        out.append(("social_posts", social, select(social, ts.label("_ts")), ts))
+    return out
+
+
+def _load_state(out_dir):
+    path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_state(out_dir, state):
+    path = os.path.join(out_dir, STATE_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _swap_in(new_dir, table_dir, run_id):
+    """Replace table_dir with new_dir (a full snapshot); an empty export leaves an empty dataset"""
+    if not os.path.exists(new_dir):
+        os.makedirs(new_dir)
+    old_dir = f"{table_dir}.old-{run_id}"
+    if os.path.exists(table_dir):
+        os.rename(table_dir, old_dir)
+    os.rename(new_dir, table_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _previous_watermarks(state):
+    if "watermarks" in state:
+        return {name: datetime.fromisoformat(ts) for name, ts in state["watermarks"].items()}
+    if state.get("last_snapshot_at"):  # state written before per-table watermarks
+        ts = datetime.fromisoformat(state["last_snapshot_at"])
+        return {"places": ts, "reviews": ts, "social_posts": ts}
+    return {}
+
+
+def write_snapshot(engine, out_dir, incremental=False, batch_size=50_000, compression="zstd",
+                   lag=DEFAULT_LAG):
+    """
+    Export places/reviews/social_posts from `engine` to Parquet under `out_dir`.
+
+    Every run exports rows stamped up to cutoff = now - lag (a full run also
+    rows with no timestamp) and stores cutoff as each table's watermark. An
+    incremental run reads (previous watermark, cutoff], so windows never
+    overlap and a run with no changes writes nothing.
+    Returns {"run_id", "since": {table: iso}, "until": iso, "rows": {table: count}}.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError:
+        raise RuntimeError("pyarrow is required for snapshots: pip install pyarrow")
+
+    os.makedirs(out_dir, exist_ok=True)
+    state = _load_state(out_dir)
+    previous = _previous_watermarks(state) if incremental else {}
+    started = datetime.utcnow()
+    cutoff = started - lag
+    run_id = started.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:8]
+
+    metadata = MetaData()
+    metadata.reflect(engine)
+
+    rows_written, since_used = {}, {}
+    with engine.connect() as conn:
+        for name, table, stmt, ts_col in _snapshot_queries(metadata):
+            # a table without a previous watermark gets a full export, even in incremental mode
+            since = previous.get(name)
+            if since is not None:
+                stmt = stmt.where(ts_col > since, ts_col <= cutoff)
+            else:
+                stmt = stmt.where(or_(ts_col <= cutoff, ts_col.is_(None)))
+            since_used[name] = since.isoformat() if since else None
+            columns = [c.name for c in table.columns]
+            schema = pa.schema(
+                [pa.field(c.name, _arrow_type(pa, c)) for c in table.columns]
+                + [pa.field(PARTITION_COLUMN, pa.string())]
+            )
+            count = 0
+
+            def batches(stmt=stmt, columns=columns, schema=schema):
+                nonlocal count
+                result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(stmt)
+                for rows in result.partitions():
+                    data = {c: [r[i] for r in rows] for i, c in enumerate(columns)}
+                    data[PARTITION_COLUMN] = [r[-1].date().isoformat() if r[-1] else "unknown" for r in rows]
+                    count += len(rows)
+                    yield pa.RecordBatch.from_pydict(data, schema=schema)
+
+            # incremental: new part files next to the existing ones.
+            # full: write to a temp dir and swap it in, so the dataset holds exactly one copy.
+            table_dir = os.path.join(out_dir, name)
+            target = table_dir if since is not None else f"{table_dir}.tmp-{run_id}"
+            ds.write_dataset(
+                pa.RecordBatchReader.from_batches(schema, batches()),
+                target,
+                format="parquet",
+                partitioning=[PARTITION_COLUMN],
+                partitioning_flavor="hive",
+                basename_template=f"part-{run_id}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+                file_options=ds.ParquetFileFormat().make_write_options(compression=compression),
+            )
+            if since is None:
+                _swap_in(target, table_dir, run_id)
+            rows_written[name] = count
+
+    _save_state(out_dir, {
+        "watermarks": {name: cutoff.isoformat() for name in rows_written},
+        "last_snapshot_at": started.isoformat(),
+        "last_run_id": run_id,
+    })
+    return {
+        "run_id": run_id,
+        "since": since_used,
+        "until": cutoff.isoformat(),
+        "rows": rows_written,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a Parquet snapshot of globemate.db")
+    parser.add_argument("--db", default=os.getenv("DATABASE_URL", "sqlite:///globemate.db"))
+    parser.add_argument("--out", default=os.getenv("SNAPSHOT_DIR", "snapshots"))
+    parser.add_argument("--incremental", action="store_true", help="only rows changed since the last snapshot")
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--lag", type=int, default=int(DEFAULT_LAG.total_seconds()),
+                        help="only export rows stamped at least this many seconds ago")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.db)
+    result = write_snapshot(engine, args.out, incremental=args.incremental, batch_size=args.batch_size,
+                            lag=timedelta(seconds=args.lag))
+    print(f"📦 Snapshot {result['run_id']} -> {args.out}")
+    for name, count in result["rows"].items():
+        print(f"  {name}: {count} rows")
+
+
+if __name__ == "__main__":
+    main()
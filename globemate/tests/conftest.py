@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# server.py reads its secrets and DB URL at import time, and mounts static/ and
+# templates/ relative to cwd; set all of that up before any test imports it.
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("GOOGLE_PLACES_KEY", "test")
+os.environ.setdefault("BROWSER_KEY", "test")
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+os.chdir(HERE)
+sys.path.insert(0, HERE)
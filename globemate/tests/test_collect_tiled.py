@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+import requests
+
+import collect_south_america as collect
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(collect.time, "sleep", lambda s: None)
+
+
+def test_split_bounds_covers_the_box_without_gaps():
+    cells = collect.split_bounds((0.0, 10.0, 3.0, 16.0), 3)
+    assert len(cells) == 9
+    assert cells[0] == (0.0, 10.0, 1.0, 12.0)
+    assert cells[-1] == (2.0, 14.0, 3.0, 16.0)
+    # neighbouring cells share their edges
+    assert cells[0][3] == cells[1][1]
+    assert cells[0][2] == cells[3][0]
+
+
+def test_find_city_bounds_prefers_the_longest_whole_word_match(monkeypatch):
+    monkeypatch.setitem(collect.CITY_BOUNDS, "york", (0.0, 0.0, 1.0, 1.0))
+    assert collect.find_city_bounds("hostels in New York") == collect.CITY_BOUNDS["new york"]
+    assert collect.find_city_bounds("best hostels in York") == (0.0, 0.0, 1.0, 1.0)
+    assert collect.find_city_bounds("romeo and juliet tours") is None
+
+
+def test_tiled_search_subdivides_full_cells_and_counts_failed_ones(monkeypatch):
+    bounds = (0.0, 0.0, 2.0, 2.0)
+    failing_cell = collect.split_bounds(bounds, 2)[3]
+    calls = []
+    lock = threading.Lock()
+
+    def fake_search(text_query, limit=20, bounds_=None, raise_errors=False):
+        with lock:
+            calls.append(bounds_)
+        if bounds_ == bounds:
+            # the whole city hits the cap, so it is split into 4
+            return [{"id": f"top-{i}"} for i in range(collect.SEARCH_RESULT_CAP)]
+        if bounds_ == failing_cell:
+            raise requests.Timeout("timed out")
+        return [{"id": f"cell-{bounds_[0]}-{bounds_[1]}"}, {"id": "top-0"}]
+
+    monkeypatch.setattr(collect, "google_text_search", fake_search)
+    places = collect.tiled_search("hostels", bounds, grid=1, max_depth=1, workers=3, rate=0, retries=2)
+
+    ids = sorted(p["id"] for p in places)
+    assert len(ids) == collect.SEARCH_RESULT_CAP + 3  # deduped across cells
+    assert "cell-1.0-1.0" not in ids
+    # 1 city search + 3 good sub-cells + the failing one tried 1 + 2 retries
+    assert len(calls) == 1 + 3 + 3
+    assert calls.count(failing_cell) == 3
+
+
+def test_tiled_search_stops_subdividing_at_max_depth(monkeypatch):
+    def always_full(text_query, limit=20, bounds_=None, raise_errors=False):
+        return [{"id": f"{bounds_}-{i}"} for i in range(collect.SEARCH_RESULT_CAP)]
+
+    monkeypatch.setattr(collect, "google_text_search", always_full)
+    places = collect.tiled_search("hostels", (0.0, 0.0, 1.0, 1.0), grid=2, max_depth=1, workers=2, rate=0)
+    # 4 cells at depth 0, each split once into 4
+    assert len(places) == (4 + 16) * collect.SEARCH_RESULT_CAP
+
+
+def test_main_skips_details_for_places_already_saved(monkeypatch):
+    collect.save_to_database({"place_id": "known-1", "name": "Known"})
+    details_calls = []
+
+    def fake_details(place_id):
+        details_calls.append(place_id)
+        return {"displayName": {"text": place_id}}
+
+    monkeypatch.setattr(collect, "GLOBAL_SEARCH_QUERIES", ["hostels somewhere"])
+    monkeypatch.setattr(collect, "google_text_search",
+                        lambda *a, **kw: [{"id": "known-1"}, {"id": "new-1"}])
+    monkeypatch.setattr(collect, "get_place_details", fake_details)
+
+    collect.main([])
+
+    assert details_calls == ["new-1"]
+    assert collect.existing_place_ids(["known-1", "new-1", "missing"]) == {"known-1", "new-1"}
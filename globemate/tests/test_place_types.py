@@ -0,0 +1,82 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import server
+
+
+@pytest.mark.parametrize("raw,expected", [
+    (["hostel", "bar", "hostel"], ["hostel", "bar"]),
+    ('["hostel", "bar"]', ["hostel", "bar"]),
+    ('[["hostel", "bar"], ["bar", "cafe"]]', ["hostel", "bar", "cafe"]),
+    ("lodging", ["lodging"]),
+    ("", []),
+    (None, []),
+])
+def test_type_list(raw, expected):
+    assert server._type_list(raw) == expected
+
+
+def _insert_raw_places(rows):
+    now = datetime.utcnow()
+    with server.engine.begin() as conn:
+        conn.execute(server.Place.__table__.insert(), [
+            {"place_id": pid, "name": pid, "types": types, "updated_at": now} for pid, types in rows
+        ])
+
+
+def _type_rows(place_id):
+    with server.engine.connect() as conn:
+        return sorted(conn.execute(
+            server.select(server.PlaceType.type).where(server.PlaceType.place_id == place_id)
+        ).scalars())
+
+
+def test_backfill_flattens_legacy_nested_types():
+    _insert_raw_places([
+        ("tt-nested", json.dumps([["tt_hostel", "tt_bar"], ["tt_bar"]])),
+        ("tt-plain", "tt_lodging"),
+    ])
+    server._backfill_place_types()
+    assert _type_rows("tt-nested") == ["tt_bar", "tt_hostel"]
+    assert _type_rows("tt-plain") == ["tt_lodging"]
+    # a second run does not duplicate rows
+    server._backfill_place_types()
+    assert _type_rows("tt-nested") == ["tt_bar", "tt_hostel"]
+
+
+@pytest.fixture(scope="module")
+def typed_places():
+    _insert_raw_places([
+        ("tf-a", json.dumps(["tf_hostel", "tf_bar"])),
+        ("tf-b", json.dumps(["tf_hostel"])),
+        ("tf-c", json.dumps(["tf_bar", "tf_cafe"])),
+    ])
+    server._backfill_place_types()
+
+
+def _ids(**kwargs):
+    params = dict(q=None, min_rating=None, types=None, types_match="any", limit=50, offset=0)
+    params.update(kwargs)
+    result = server.list_places(**params)
+    ids = sorted(it["place_id"] for it in result["items"])
+    assert result["total"] == len(ids)
+    return ids
+
+
+def test_list_places_types_any(typed_places):
+    assert _ids(types="tf_hostel") == ["tf-a", "tf-b"]
+    assert _ids(types="tf_hostel, tf_cafe") == ["tf-a", "tf-b", "tf-c"]
+
+
+def test_list_places_types_all(typed_places):
+    assert _ids(types="tf_hostel,tf_bar", types_match="all") == ["tf-a"]
+    # a repeated type counts once
+    assert _ids(types="tf_bar,tf_bar", types_match="all") == ["tf-a", "tf-c"]
+    assert _ids(types="tf_hostel,tf_cafe", types_match="all") == []
+
+
+def test_list_places_returns_flat_types(typed_places):
+    item = server.list_places(q="tf-a", min_rating=None, types=None, types_match="any", limit=1, offset=0)["items"][0]
+    assert item["types"] == ["tf_hostel", "tf_bar"]
@@ -0,0 +1,55 @@
+import time
+import threading
+
+import server
+
+
+def _wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_concurrent_callers_share_one_upstream_call_and_its_error():
+    flight = server.SingleFlight()
+    release = threading.Event()
+    upstream_calls = []
+
+    def upstream():
+        upstream_calls.append(1)
+        release.wait(5)
+        raise RuntimeError("quota exceeded")
+
+    n = 8
+    errors = [None] * n
+
+    def call(i):
+        try:
+            flight.do("details:abc", upstream)
+        except RuntimeError as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    # all followers joined the leader's flight before it finishes
+    _wait_for(lambda: flight.stats["calls"] == n)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(upstream_calls) == 1
+    assert all(e is errors[0] for e in errors) and str(errors[0]) == "quota exceeded"
+    assert flight.stats == {"calls": n, "upstream": 1, "coalesced": n - 1}
+
+    # no caching: once the flight has landed, the next call goes upstream again
+    assert flight.do("details:abc", lambda: {"id": "abc"}) == {"id": "abc"}
+    assert flight.stats == {"calls": n + 1, "upstream": 2, "coalesced": n - 1}
+
+
+def test_different_keys_do_not_coalesce():
+    flight = server.SingleFlight()
+    assert flight.do("a", lambda: 1) == 1
+    assert flight.do("b", lambda: 2) == 2
+    assert flight.stats == {"calls": 2, "upstream": 2, "coalesced": 0}
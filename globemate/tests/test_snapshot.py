@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+
+import server
+import snapshot
+
+ds = pytest.importorskip("pyarrow.dataset")
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/snap.db")
+    server.Base.metadata.create_all(engine)
+    return engine
+
+
+def _add_places(engine, ids, stamped):
+    with engine.begin() as conn:
+        conn.execute(server.Place.__table__.insert(), [
+            {"place_id": pid, "name": pid, "created_at": stamped, "updated_at": stamped} for pid in ids
+        ])
+
+
+def _rows(out_dir, table):
+    return ds.dataset(str(out_dir / table), partitioning="hive").to_table().num_rows
+
+
+def test_incremental_without_changes_writes_nothing(engine, tmp_path):
+    out = tmp_path / "snap"
+    _add_places(engine, ["a", "b"], datetime.utcnow() - timedelta(days=1))
+
+    assert snapshot.write_snapshot(engine, str(out))["rows"]["places"] == 2
+    for _ in range(3):
+        assert snapshot.write_snapshot(engine, str(out), incremental=True)["rows"]["places"] == 0
+    assert _rows(out, "places") == 2
+
+
+def _ids(out_dir, table):
+    return sorted(ds.dataset(str(out_dir / table), partitioning="hive").to_table()["place_id"].to_pylist())
+
+
+def test_full_snapshot_replaces_dataset(engine, tmp_path):
+    out = tmp_path / "snap"
+    _add_places(engine, ["a", "b"], datetime.utcnow() - timedelta(days=1))
+    snapshot.write_snapshot(engine, str(out))
+    snapshot.write_snapshot(engine, str(out))
+    assert _ids(out, "places") == ["a", "b"]
+
+    with engine.begin() as conn:
+        conn.execute(server.Place.__table__.delete().where(server.Place.place_id == "b"))
+    snapshot.write_snapshot(engine, str(out))
+    assert _ids(out, "places") == ["a"]
+
+
+def test_incremental_picks_up_changed_and_late_committed_rows(engine, tmp_path):
+    out = tmp_path / "snap"
+    now = datetime.utcnow()
+    _add_places(engine, ["a", "b"], now - timedelta(days=1))
+    # stamped inside the lag window: treated as possibly uncommitted, left for the next run
+    _add_places(engine, ["late"], now - timedelta(minutes=1))
+
+    first = snapshot.write_snapshot(engine, str(out), lag=timedelta(minutes=5))
+    assert first["rows"]["places"] == 2
+
+    with engine.begin() as conn:
+        conn.execute(server.Place.__table__.update()
+                     .where(server.Place.place_id == "a").values(updated_at=datetime.utcnow()))
+    second = snapshot.write_snapshot(engine, str(out), incremental=True, lag=timedelta(0))
+    assert second["rows"]["places"] == 2
+    assert _ids(out, "places") == ["a", "a", "b", "late"]
+
+
+def test_legacy_state_file_is_read(engine, tmp_path):
+    out = tmp_path / "snap"
+    out.mkdir()
+    now = datetime.utcnow()
+    _add_places(engine, ["old"], now - timedelta(days=2))
+    _add_places(engine, ["new"], now - timedelta(hours=1))
+    legacy = (now - timedelta(days=1)).isoformat()
+    (out / snapshot.STATE_FILE).write_text(f'{{"last_snapshot_at": "{legacy}"}}')
+
+    result = snapshot.write_snapshot(engine, str(out), incremental=True, lag=timedelta(0))
+    assert result["since"]["places"] == legacy
+    assert _ids(out, "places") == ["new"]
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import server
+
+
+def _fresh_session():
+    engine = create_engine("sqlite://")
+    server.Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)()
+
+
+def _apply_all(items):
+    ses = _fresh_session()
+    for item in items:
+        server._apply_place_item(ses, item)
+        ses.commit()
+    place = ses.get(server.Place, "p")
+    out = {c: getattr(place, c) for c in server.PLACE_LIST_KEYS if c != "updated_at"}
+    out["type_rows"] = sorted(pt.type for pt in place.type_rows)
+    out["reviews"] = sorted((rv.id, rv.text) for rv in ses.query(server.Review))
+    ses.close()
+    return out
+
+
+SEED = {"place_id": "p", "name": "Seed", "reviews_count": 3, "rating": 4.0, "types": ["bar"]}
+
+CASES = [
+    ({"place_id": "p", "reviews_count": 5}, {"place_id": "p", "reviews_count": 0}),
+    ({"place_id": "p", "types": ["hostel", "bar"]}, {"place_id": "p", "types": []}),
+    ({"place_id": "p", "types": ["hostel"]}, {"place_id": "p", "types": None}),
+    ({"place_id": "p", "types": ["hostel"]}, {"place_id": "p", "types": '["cafe"]'}),
+    ({"place_id": "p", "name": "A"}, {"place_id": "p", "name": ""}),
+    ({"place_id": "p", "rating": 4.5}, {"place_id": "p", "rating": 0.0}),
+    ({"place_id": "p", "rating": 4.5}, {"place_id": "p", "rating": None}),
+    ({"place_id": "p", "lat": 1.5, "lng": 2.5}, {"place_id": "p", "lat": 0.0}),
+    ({"place_id": "p", "summary": "x", "website": "w"}, {"place_id": "p", "summary": None, "phone": "1"}),
+    (
+        {"place_id": "p", "reviews": [{"id": "r1", "text": "first"}, {"text": "no id"}]},
+        {"place_id": "p", "reviews": [{"id": "r1", "text": "second"}, {"id": "r2", "text": "new"}]},
+    ),
+]
+
+
+@pytest.mark.parametrize("first,second", CASES)
+def test_merge_then_apply_equals_sequential_apply(first, second):
+    sequential = _apply_all([SEED, first, second])
+    merged = _apply_all([SEED, server._merge_place_items(first, second)])
+    assert merged == sequential
+
+
+def test_flush_dead_letters_bad_item_and_writes_the_rest(tmp_path):
+    buf = server.WriteBehindBuffer(100, 60, str(tmp_path / "wb.journal"))
+    buf.dead_letter_path = str(tmp_path / "wb.dead.jsonl")
+    buf.submit([
+        {"place_id": "wb-first", "name": "First"},
+        {"place_id": "wb-bad", "name": {"x": 1}},
+        {"place_id": "wb-good", "name": "Good"},
+    ])
+
+    assert buf.flush() == 2
+    assert buf.pending() == 0
+    assert not os.path.exists(buf.journal_path)
+
+    ses = server.SessionLocal()
+    try:
+        assert ses.get(server.Place, "wb-first").name == "First"
+        assert ses.get(server.Place, "wb-good").name == "Good"
+        assert ses.get(server.Place, "wb-bad") is None
+    finally:
+        ses.close()
+
+    with open(buf.dead_letter_path, encoding="utf-8") as f:
+        dead = [json.loads(line) for line in f]
+    assert [d["item"]["place_id"] for d in dead] == ["wb-bad"]
+    assert buf.stats["dead_lettered"] == 1
+
+
+@pytest.mark.parametrize("bad", [
+    {"place_id": "p", "reviews": {"id": "r1"}},
+    {"place_id": ["p"]},
+    {"place_id": "p", "reviews": ["r1"]},
+])
+def test_submit_rejects_malformed_item_before_journaling(tmp_path, bad):
+    buf = server.WriteBehindBuffer(100, 60, str(tmp_path / "wb.journal"))
+    with pytest.raises(ValueError):
+        buf.submit([{"place_id": "ok"}, bad])
+    assert not os.path.exists(buf.journal_path)
+    assert buf.pending() == 0
+    buf.submit([{"place_id": "p"}])
+    assert buf.pending() == 1
+
+
+def test_replay_dead_letters_unmergeable_journal_lines(tmp_path):
+    journal = tmp_path / "wb.journal"
+    journal.write_text(
+        json.dumps([{"place_id": "p", "reviews": {"id": "r1"}}]) + "\n"
+        + json.dumps([{"place_id": "p"}, {"place_id": ["x"]}, {"place_id": "q", "name": "Q"}]) + "\n"
+    )
+    buf = server.WriteBehindBuffer(100, 60, str(journal))
+    buf.dead_letter_path = str(tmp_path / "wb.dead.jsonl")
+
+    buf.start()
+    try:
+        assert buf.stats["dead_lettered"] == 2
+    finally:
+        buf.stop()
+
+    ses = server.SessionLocal()
+    try:
+        assert ses.get(server.Place, "q").name == "Q"
+    finally:
+        ses.close()
+
+
+def test_concurrent_submits_share_journal_fsyncs(tmp_path, monkeypatch):
+    fsyncs = []
+    real_fsync = os.fsync
+
+    def slow_fsync(fd):
+        fsyncs.append(fd)
+        time.sleep(0.05)
+        real_fsync(fd)
+
+    monkeypatch.setattr(server, "WRITE_BEHIND_FSYNC", True)
+    monkeypatch.setattr(os, "fsync", slow_fsync)
+    buf = server.WriteBehindBuffer(1000, 60, str(tmp_path / "wb.journal"))
+
+    n = 20
+    barrier = threading.Barrier(n)
+
+    def submit(i):
+        barrier.wait()
+        buf.submit([{"place_id": f"p{i}"}])
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert buf.pending() == n
+    assert buf._synced_seq == n
+    assert buf.stats["journal_syncs"] == len(fsyncs) < n
+    with open(buf.journal_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == n